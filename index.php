@@ -5,6 +5,15 @@
 // Changed to the absolute path where sensor_collector.py writes the database
 define('DATABASE_PATH', '/home/wan/sensor/sensor_data.db'); 
 
+// Timestamps are stored as INTEGER microseconds since the Unix epoch and
+// temperature as INTEGER hundredths of a degree, so both are converted by SQLite
+define('SELECT_COLUMNS', "
+    strftime('%Y-%m-%d', timestamp / 1000000, 'unixepoch', 'localtime') AS date,
+    strftime('%H:%M', timestamp / 1000000, 'unixepoch', 'localtime') AS time,
+    temperature / 100.0 AS temperature,
+    humidity
+");
+
 // --- CORS Headers ---
 // Allow requests from any origin (for development).
 // In production, you might want to restrict this to your frontend's domain.
@@ -39,24 +48,18 @@ function getDbConnection() {
 
 // --- API Data Formatting Helper ---
 function formatSensorDataFromRow($row, $includeDate = true) {
-    // Create a DateTime object from the full timestamp string from the database
-    // The timestamp format from sensor_collector.py is 'Y-m-d H:i:s.u'
-    $dtObject = new DateTime($row['timestamp']);
-    
-    // Format time to exclude seconds and microseconds (e.g., "14:30")
-    $formattedTime = $dtObject->format('H:i'); // H for 24-hour format, i for minutes
-    
     // Prepare the basic formatted data array
+    // The time is already formatted by the query (e.g., "14:30")
     $formattedData = [
-        "time"  => $formattedTime,
-        // Convert temperature and humidity to string as requested by the user
-        "temp"  => (string)round($row['temperature'], 2), // Round temperature to 2 decimal places
-        "humid" => (string)(int)$row['humidity'] // Ensure humidity is an integer before converting to string
+        "time"  => $row['time'],
+        // Temperature and humidity are returned as JSON numbers
+        "temp"  => round($row['temperature'], 2), // Round temperature to 2 decimal places
+        "humid" => (int)$row['humidity'] // Ensure humidity is an integer
     ];
 
     // Conditionally add the 'date' field if requested
     if ($includeDate) {
-        $formattedData["date"] = $dtObject->format('Y-m-d'); // Format date as "YYYY-MM-DD"
+        $formattedData["date"] = $row['date']; // Already formatted as "YYYY-MM-DD"
     }
     
     return $formattedData;
@@ -121,7 +124,7 @@ function handleHistoryEndpoint() {
     }
 
     // Construct the base SQL query
-    $query = "SELECT timestamp, temperature, humidity FROM sensor_readings ORDER BY timestamp " . ($order === 'asc' ? 'ASC' : 'DESC');
+    $query = "SELECT " . SELECT_COLUMNS . " FROM sensor_readings ORDER BY timestamp " . ($order === 'asc' ? 'ASC' : 'DESC');
     
     // Add LIMIT clause if 'limit' parameter is provided
     if ($limit !== null) {
@@ -159,7 +162,7 @@ function handleLatestEndpoint() {
 
     try {
         // Query to get the single latest sensor reading
-        $stmt = $pdo->query("SELECT timestamp, temperature, humidity FROM sensor_readings ORDER BY timestamp DESC LIMIT 1");
+        $stmt = $pdo->query("SELECT " . SELECT_COLUMNS . " FROM sensor_readings ORDER BY timestamp DESC LIMIT 1");
         $row = $stmt->fetch(); // Fetch the single row
 
         if ($row) {
@@ -188,22 +191,20 @@ function handleDailyHistoryEndpoint($dateStr) {
         return;
     }
 
-    // Define the start and end timestamps for the given day
-    $startOfDay = $dateStr . " 00:00:00.000000";
-    $endOfDay = $dateStr . " 23:59:59.999999";
-
-    // SQL query to select data within the specified date range
+    // SQL query to select data within the specified local day
+    // (SQLite converts the day's local midnight boundaries to Unix microseconds)
     $query = "
-        SELECT timestamp, temperature, humidity 
+        SELECT " . SELECT_COLUMNS . "
         FROM sensor_readings 
-        WHERE timestamp BETWEEN :start_of_day AND :end_of_day 
+        WHERE timestamp >= CAST(strftime('%s', :start_of_day, 'utc') AS INTEGER) * 1000000
+          AND timestamp < CAST(strftime('%s', :end_of_day, '+1 day', 'utc') AS INTEGER) * 1000000
         ORDER BY timestamp ASC
     ";
     
     try {
         $stmt = $pdo->prepare($query); // Prepare the SQL statement
-        $stmt->bindParam(':start_of_day', $startOfDay); // Bind start of day parameter
-        $stmt->bindParam(':end_of_day', $endOfDay);   // Bind end of day parameter
+        $stmt->bindParam(':start_of_day', $dateStr); // Bind start of day parameter
+        $stmt->bindParam(':end_of_day', $dateStr);   // Bind end of day parameter
         $stmt->execute(); // Execute the query
         $rows = $stmt->fetchAll(); // Fetch all results
 
@@ -231,12 +232,12 @@ function handleDailyHistoryEndpoint($dateStr) {
 function handleLast24HoursEndpoint() {
     $pdo = getDbConnection(); // Get a database connection
 
-    // Calculate the timestamp for 24 hours ago from the current time
-    $time24HoursAgo = (new DateTime())->modify('-24 hours')->format('Y-m-d H:i:s.u');
+    // Calculate the timestamp for 24 hours ago from the current time, in Unix microseconds
+    $time24HoursAgo = (time() - 24 * 3600) * 1000000;
 
     // SQL query to select data from the last 24 hours
     $query = "
-        SELECT timestamp, temperature, humidity 
+        SELECT " . SELECT_COLUMNS . "
         FROM sensor_readings 
         WHERE timestamp >= :time_24_hours_ago 
         ORDER BY timestamp ASC
@@ -244,7 +245,7 @@ function handleLast24HoursEndpoint() {
     
     try {
         $stmt = $pdo->prepare($query); // Prepare the SQL statement
-        $stmt->bindParam(':time_24_hours_ago', $time24HoursAgo); // Bind the timestamp parameter
+        $stmt->bindParam(':time_24_hours_ago', $time24HoursAgo, PDO::PARAM_INT); // Bind the timestamp parameter
         $stmt->execute(); // Execute the query
         $rows = $stmt->fetchAll(); // Fetch all results
 
@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import sys
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+
+DATABASE_NAME = "sensor_data.db"
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), DATABASE_NAME)
+
+# One-off migration of an existing sensor_data.db to the current schema:
+# TEXT 'YYYY-MM-DD HH:MM:SS.ffffff' local timestamps become INTEGER
+# microseconds since the Unix epoch, and REAL temperatures become INTEGER
+# hundredths of °C. Rows that are already migrated are copied unchanged,
+# so running the script twice is harmless. Rows with a missing reading are
+# dropped. Stop sensor_collector.py before running it, and only start the
+# upgraded collector afterwards.
+
+def migrate_database(conn):
+    conn.execute('BEGIN')
+    try:
+        conn.execute('''
+            CREATE TABLE sensor_readings_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp INTEGER NOT NULL,
+                temperature INTEGER NOT NULL,
+                humidity INTEGER NOT NULL
+            )
+        ''')
+        cursor = conn.execute('''
+            INSERT INTO sensor_readings_new (id, timestamp, temperature, humidity)
+            SELECT
+                id,
+                CASE WHEN typeof(timestamp) = 'text'
+                    THEN CAST(strftime('%s', substr(timestamp, 1, 19), 'utc') AS INTEGER) * 1000000
+                         + CAST(substr(timestamp, 21, 6) AS INTEGER)
+                    ELSE timestamp
+                END,
+                CASE WHEN typeof(temperature) = 'real'
+                    THEN CAST(round(temperature * 100) AS INTEGER)
+                    ELSE temperature
+                END,
+                humidity
+            FROM sensor_readings
+            WHERE temperature IS NOT NULL AND humidity IS NOT NULL
+        ''')
+        migrated_rows = cursor.rowcount
+        conn.execute('DROP TABLE sensor_readings')
+        conn.execute('ALTER TABLE sensor_readings_new RENAME TO sensor_readings')
+        conn.execute('''
+            CREATE INDEX idx_sr_ts ON sensor_readings (timestamp, temperature, humidity)
+        ''')
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return migrated_rows
+
+if __name__ == "__main__":
+    if not os.path.exists(DB_PATH):
+        logging.error(f"Error: {DB_PATH} not found. Nothing to migrate.")
+        sys.exit(1)
+
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    try:
+        migrated_rows = migrate_database(conn)
+        conn.execute('VACUUM')
+        logging.info(f"Migrated {migrated_rows} records in {DB_PATH}.")
+    except Exception as e:
+        logging.critical(f"Migration failed, database left unchanged: {e}", exc_info=True)
+        sys.exit(1)
+    finally:
+        conn.close()
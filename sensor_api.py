@@ -1,108 +1,242 @@
 import os
-import sqlite3
-import json
-from datetime import datetime
-from flask import Flask, jsonify, request
-from flask_cors import CORS
+import queue
+import sys
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from itertools import chain
+import apsw
+from orjson import dumps as _dumps
+from sensor_format import format_sensor_data_from_row as _format_sensor_data_from_row
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
 
 DATABASE_NAME = "sensor_data.db"
+DB_POOL_SIZE = 8
+LATEST_CACHE_TTL_SECONDS = 30
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), DATABASE_NAME)
 
-app = Flask(__name__)
-CORS(app)
+# Long-lived read-only connections shared between requests
+_POOL = queue.Queue(maxsize=DB_POOL_SIZE)
+
+# Pre-encoded /latest response body and its ETag, refreshed at most once per
+# LATEST_CACHE_TTL_SECONDS. Both are stored as one tuple so readers never see a mismatched pair
+_latest_cache = {"exp": 0.0, "entry": (b"", "")}
+_latest_lock = threading.Lock()
 
 def get_db_connection():
-    """Establishes and returns a connection to the SQLite database."""
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    db_path = os.path.join(script_dir, DATABASE_NAME)
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row # Allows accessing columns by name
+    """
+    Opens a new read-only APSW connection to the SQLite database.
+    Rows are returned as plain tuples, and each connection keeps its prepared
+    statements in APSW's statement cache for as long as it lives in the pool.
+    The collector puts the database in WAL mode, so readers never block it.
+    """
+    conn = apsw.Connection(DB_PATH, flags=apsw.SQLITE_OPEN_READONLY)
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-20000") # ~20 MB page cache per connection
     return conn
 
-def _format_sensor_data_from_row(row, include_date=True):
+@contextmanager
+def borrow():
+    """
+    Borrows a connection from the pool, opening a new one if the pool is empty.
+    The connection is handed back to the pool (or closed if the pool is full) on exit.
     """
-    Helper function to parse a database row and format sensor data
-    into the desired dictionary structure.
+    try:
+        conn = _POOL.get_nowait()
+    except queue.Empty:
+        conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        try:
+            _POOL.put_nowait(conn)
+        except queue.Full:
+            conn.close()
 
-    Args:
-        row (sqlite3.Row): A single row fetched from the database.
-        include_date (bool): If True, includes the 'date' field in the output.
+def _json(obj, status=200):
+    """Builds a JSON response, encoding the payload with orjson."""
+    return Response(_dumps(obj), status_code=status, media_type='application/json')
 
-    Returns:
-        dict: Formatted sensor data.
-    """
-    # Parse the full timestamp string from the database
-    dt_object = datetime.strptime(row["timestamp"], '%Y-%m-%d %H:%M:%S.%f')
-    
-    # Format time (excluding seconds and microseconds)
-    formatted_time = dt_object.strftime('%H:%M')
-    
-    formatted_data = {
-        "time": formatted_time,
-        "temp": str(row["temperature"]), # Converted to string
-        "humid": str(row["humidity"]) # Converted to string
-    }
-
-    if include_date:
-        formatted_data["date"] = dt_object.strftime('%Y-%m-%d')
-    
-    return formatted_data
-
-@app.route('/history', methods=['GET'])
-def get_all_sensor_data():
+def _int_arg(request, name):
+    """Returns an integer query parameter, or None if it is missing or not an integer."""
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return None
+
+# Timestamps are stored as INTEGER microseconds since the Unix epoch and temperature
+# as INTEGER hundredths of °C. Formatting is done by SQLite, so rows come back
+# already in the API's output shape
+_HISTORY_COLUMNS = (
+    "strftime('%H:%M', timestamp / 1000000, 'unixepoch', 'localtime') AS time, "
+    "temperature / 100.0 AS temp, "
+    "humidity AS humid, "
+    "strftime('%Y-%m-%d', timestamp / 1000000, 'unixepoch', 'localtime') AS date"
+)
+_LATEST_COLUMNS = (
+    "strftime('%H:%M', timestamp / 1000000, 'unixepoch', 'localtime') AS time, "
+    "temperature / 100.0 AS temp, "
+    "humidity AS humid, "
+    "timestamp" # Only used for the ETag
+)
+
+def _history_query(order, paginate=False, after=False):
+    """Builds the /history SQL for one combination of query parameters."""
+    columns = _HISTORY_COLUMNS
+    if paginate:
+        # The raw timestamp is needed as the cursor for the next page
+        columns += ", timestamp AS next"
+    where = ""
+    if after:
+        where = " WHERE timestamp < ?" if order == 'desc' else " WHERE timestamp > ?"
+    # LIMIT is always bound; a negative LIMIT means no limit in SQLite
+    return "SELECT " + columns + " FROM sensor_readings" + where + " ORDER BY timestamp " + order.upper() + " LIMIT ?"
+
+# Every statement the API runs is a fixed string built once here, so each pooled
+# connection prepares it once and then reuses it from APSW's statement cache
+_HISTORY_QUERIES = {
+    (order, paginate, after): _history_query(order, paginate, after)
+    for order in ('asc', 'desc')
+    for paginate in (False, True)
+    for after in (False, True)
+    if paginate or not after
+}
+_LATEST_QUERY = "SELECT " + _LATEST_COLUMNS + " FROM sensor_readings ORDER BY timestamp DESC LIMIT 1"
+
+async def get_all_sensor_data(request):
     """
     API endpoint to retrieve all sensor data.
     Supports optional 'limit' and 'order' (asc/desc) query parameters.
     Example: http://127.0.0.1:3040/history?limit=10&order=desc
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
 
-    limit = request.args.get('limit', type=int)
-    order = request.args.get('order', default='desc', type=str).lower()
+    Passing 'after' switches to keyset pagination: only readings after the given
+    cursor (in the requested order) are returned, wrapped in an object with the
+    cursor for the next page. Start with an empty 'after' to get the first page.
+    Example: http://127.0.0.1:3040/history?limit=100&after=
+    """
+    limit = _int_arg(request, 'limit')
+    order = request.query_params.get('order', 'desc').lower()
+    after = request.query_params.get('after')
+    paginate = after is not None
 
     if order not in ['asc', 'desc']:
-        return jsonify({"error": "Invalid 'order' parameter. Use 'asc' or 'desc'."}), 400
+        return _json({"error": "Invalid 'order' parameter. Use 'asc' or 'desc'."}, 400)
+
+    if after:
+        try:
+            after = int(after)
+        except ValueError:
+            return _json({"error": "Invalid 'after' parameter. Use the 'next' value of the previous page."}, 400)
+    else:
+        after = None
 
-    # Keep timestamp in the query as it's needed for sorting and retrieval
-    query = "SELECT timestamp, temperature, humidity FROM sensor_readings ORDER BY timestamp " + order
-    if limit:
-        query += f" LIMIT {limit}"
+    query = _HISTORY_QUERIES[order, paginate, after is not None]
+    params = (limit if limit else -1,) if after is None else (after, limit if limit else -1)
 
+    def generate():
+        # The pooled connection stays borrowed until the last row has been sent
+        with borrow() as conn:
+            cursor = conn.execute(query, params)
+            try:
+                yield b'{"data":[' if paginate else b'['
+                count = 0
+                next_after = None
+                for row in cursor:
+                    if paginate:
+                        next_after = row[4]
+                    chunk = _dumps(_format_sensor_data_from_row(row))
+                    if count:
+                        yield b','
+                    yield chunk
+                    count += 1
+                if paginate:
+                    # A short page means there is nothing left to fetch
+                    if not limit or count < limit:
+                        next_after = None
+                    yield b'],"next":' + _dumps(next_after) + b'}'
+                else:
+                    yield b']'
+            finally:
+                cursor.close()
+
+    # SQLite calls are blocking, so the generator is always advanced in the threadpool
+    rows = generate()
     try:
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        
-        # Use the helper function to format each row for /history, including the date
-        data = [_format_sensor_data_from_row(row, include_date=True) for row in rows]
-        
-        return jsonify(data), 200
+        # Run the query up front so database errors still produce a 500
+        head = await run_in_threadpool(next, rows)
     except Exception as e:
-        app.logger.error(f"Error fetching all sensor data: {e}")
-        return jsonify({"error": "Could not retrieve sensor data."}), 500
-    finally:
-        conn.close()
+        logging.error(f"Error fetching all sensor data: {e}")
+        return _json({"error": "Could not retrieve sensor data."}, 500)
 
-@app.route('/latest', methods=['GET'])
-def get_latest_sensor_data():
+    return StreamingResponse(chain([head], rows), media_type='application/json')
+
+async def get_latest_sensor_data(request):
     """
     API endpoint to retrieve the latest sensor data entry.
     Example: http://127.0.0.1:3040/latest
+
+    The response carries an ETag derived from the reading's timestamp; a poll with a
+    matching If-None-Match header gets an empty 304 Not Modified response.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    if time.monotonic() >= _latest_cache["exp"]:
+        error = await run_in_threadpool(_refresh_latest_sensor_data)
+        if error is not None:
+            return error
 
-    try:
-        cursor.execute("SELECT timestamp, temperature, humidity FROM sensor_readings ORDER BY timestamp DESC LIMIT 1")
-        row = cursor.fetchone()
-
-        if row:
-            # Use the helper function to format the single row for /latest, excluding the date
-            latest_data = _format_sensor_data_from_row(row, include_date=False)
-            return jsonify(latest_data), 200
-        else:
-            return jsonify({"message": "No sensor data found."}), 404
-    except Exception as e:
-        app.logger.error(f"Error fetching latest sensor data: {e}")
-        return jsonify({"error": "Could not retrieve latest sensor data."}), 500
-    finally:
-        conn.close()
+    body, etag = _latest_cache["entry"]
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(',')):
+        return Response(status_code=304, headers={'ETag': etag})
+    return Response(body, media_type='application/json', headers={'ETag': etag})
+
+def _refresh_latest_sensor_data():
+    """
+    Queries the latest sensor data entry and refreshes the /latest cache.
+    Returns an error response if there is nothing to cache, otherwise None.
+    """
+    with _latest_lock:
+        # Another request may have refreshed the cache while we were waiting
+        now = time.monotonic()
+        if now < _latest_cache["exp"]:
+            return None
+
+        try:
+            with borrow() as conn:
+                row = conn.execute(_LATEST_QUERY).fetchone()
+
+            if row:
+                # The date is not selected for /latest
+                latest_data = _format_sensor_data_from_row(row, include_date=False)
+                _latest_cache["entry"] = (_dumps(latest_data), f'W/"{row[3]}"')
+                _latest_cache["exp"] = now + LATEST_CACHE_TTL_SECONDS
+                return None
+            else:
+                return _json({"message": "No sensor data found."}, 404)
+        except Exception as e:
+            logging.error(f"Error fetching latest sensor data: {e}")
+            return _json({"error": "Could not retrieve latest sensor data."}, 500)
+
+app = Starlette(
+    routes=[
+        Route('/history', get_all_sensor_data, methods=['GET']),
+        Route('/latest', get_latest_sensor_data, methods=['GET']),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'])
+    ]
+)
@@ -1,13 +1,20 @@
 import asyncio
+import signal
 import sys
 import json
 import sqlite3
+import struct
 from datetime import datetime, timedelta
 from bleak import BleakClient, BleakScanner
 from bleak.exc import BleakError
 import os
 import logging
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -19,6 +26,8 @@ logging.basicConfig(
 CONFIG_FILE = "config.json"
 DATABASE_NAME = "sensor_data.db"
 DATA_RETENTION_DAYS = 7
+# Bumped whenever the sensor_readings layout changes; stored in PRAGMA user_version
+SCHEMA_VERSION = 1
 
 CONNECTION_TIMEOUT_SECONDS = 20
 DATA_CHARACTERISTIC_UUID = "ebe0ccc1-7a0a-4b0c-8a1a-6ff2997da3a6"
@@ -27,11 +36,19 @@ NOTIFICATION_WAIT_TIMEOUT_SECONDS = 10.0
 MAX_COLLECTION_RETRIES = 3
 RETRY_DELAY_SECONDS = 5
 
+# Notification payload: signed temperature in hundredths of °C, unsigned humidity in %
+_LYWSD_FMT = struct.Struct('<hB')
+
 last_saved_time = datetime.min
+_db_conn = None
+# BLEDevice found by the first successful scan, reused to skip scanning on later cycles
+cached_device = None
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(SCRIPT_DIR, DATABASE_NAME)
 
 try:
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    config_path = os.path.join(script_dir, CONFIG_FILE)
+    config_path = os.path.join(SCRIPT_DIR, CONFIG_FILE)
     with open(config_path, 'r') as f:
         config_data = json.load(f)
 except FileNotFoundError:
@@ -55,85 +72,116 @@ POLL_INTERVAL_MINUTES = config_data.get("poll_interval_minutes", 15)
 COLLECTION_INTERVAL_SECONDS = POLL_INTERVAL_MINUTES * 60
 
 def get_db_connection():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    db_path = os.path.join(script_dir, DATABASE_NAME)
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    global _db_conn
+    if _db_conn is None:
+        # One connection is kept open for the lifetime of the collector
+        _db_conn = sqlite3.connect(DB_PATH)
+        _db_conn.row_factory = sqlite3.Row
+        _db_conn.execute('PRAGMA journal_mode=WAL')
+        _db_conn.execute('PRAGMA synchronous=NORMAL')
+    return _db_conn
+
+def close_db_connection():
+    global _db_conn
+    if _db_conn is not None:
+        _db_conn.close()
+        _db_conn = None
 
 def setup_database():
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sensor_readings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp DATETIME NOT NULL,
-            temperature REAL,
-            humidity INTEGER
-        )
-    ''')
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_timestamp ON sensor_readings (timestamp)
-    ''')
-    conn.commit()
-    conn.close()
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        logging.info("Database schema is up to date.")
+        return
+
+    # A table from before INTEGER timestamps/temperatures needs migrate_db.py first
+    temperature_type = conn.execute(
+        "SELECT type FROM pragma_table_info('sensor_readings') WHERE name = 'temperature'"
+    ).fetchone()
+    if temperature_type is not None and temperature_type[0] != 'INTEGER':
+        logging.error(f"Error: {DB_PATH} uses an old schema. Stop the collector and run migrate_db.py first.")
+        sys.exit(1)
+
+    with conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sensor_readings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp INTEGER NOT NULL,
+                temperature INTEGER NOT NULL,
+                humidity INTEGER NOT NULL
+            )
+        ''')
+        # Covering index: the API's ORDER BY timestamp queries are answered from the index alone
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sr_ts ON sensor_readings (timestamp, temperature, humidity)
+        ''')
+        conn.execute('DROP INDEX IF EXISTS idx_timestamp')
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     logging.info("Database setup complete.")
 
-def store_sensor_data(temperature, humidity):
+def to_unix_micros(dt):
+    # Timestamps are stored as INTEGER microseconds since the Unix epoch
+    # (temperature as INTEGER hundredths of °C, humidity as INTEGER percent)
+    return int(dt.replace(microsecond=0).timestamp()) * 1_000_000 + dt.microsecond
+
+def store_sensor_readings(readings):
     global last_saved_time
     conn = get_db_connection()
-    cursor = conn.cursor()
-    current_time = datetime.now()
 
     try:
-        cursor.execute('''
-            INSERT INTO sensor_readings (timestamp, temperature, humidity)
-            VALUES (?, ?, ?)
-        ''', (current_time.strftime('%Y-%m-%d %H:%M:%S.%f'), temperature, humidity))
-        conn.commit()
-        last_saved_time = current_time
-        logging.info(f"Saved data: T={temperature:.2f}°C, H={humidity}% at {current_time.strftime('%Y-%m-%d %H:%M:%S')}.")
+        # All readings are written in a single transaction
+        with conn:
+            conn.executemany('''
+                INSERT INTO sensor_readings (timestamp, temperature, humidity)
+                VALUES (?, ?, ?)
+            ''', [(to_unix_micros(reading_time), round(temperature * 100), humidity)
+                  for reading_time, temperature, humidity in readings])
+        for reading_time, temperature, humidity in readings:
+            last_saved_time = reading_time
+            logging.info(f"Saved data: T={temperature:.2f}°C, H={humidity}% at {reading_time.strftime('%Y-%m-%d %H:%M:%S')}.")
     except Exception as e:
         logging.error(f"Error storing data: {e}")
-    finally:
-        conn.close()
+
+def store_sensor_data(temperature, humidity):
+    store_sensor_readings([(datetime.now(), temperature, humidity)])
 
 def apply_retention_policy():
     conn = get_db_connection()
-    cursor = conn.cursor()
     threshold_time = datetime.now() - timedelta(days=DATA_RETENTION_DAYS)
     try:
-        cursor.execute('DELETE FROM sensor_readings WHERE timestamp < ?', (threshold_time.strftime('%Y-%m-%d %H:%M:%S.%f'),))
+        with conn:
+            cursor = conn.execute('DELETE FROM sensor_readings WHERE timestamp < ?', (to_unix_micros(threshold_time),))
         deleted_rows = cursor.rowcount
-        conn.commit()
         if deleted_rows > 0:
             logging.info(f"Applied retention policy: Deleted {deleted_rows} records older than {DATA_RETENTION_DAYS} days.")
         else:
             logging.debug(f"Retention policy ran: No data older than {DATA_RETENTION_DAYS} days to delete.")
     except Exception as e:
         logging.error(f"Error applying retention policy: {e}")
-    finally:
-        conn.close()
 
 async def collect_single_reading(mac_address):
+    global cached_device
     client = None
     collected_data = None
     data_event = asyncio.Event()
 
     def notification_handler(sender, data):
         nonlocal collected_data
-        if len(data) >= 3:
-            temp = int.from_bytes(data[0:2], 'little', signed=True) / 100.0
-            humid = data[2]
-            collected_data = (temp, humid)
+        if len(data) >= _LYWSD_FMT.size:
+            temp_raw, humid = _LYWSD_FMT.unpack_from(data)
+            collected_data = (temp_raw / 100.0, humid)
             data_event.set()
 
     try:
-        logging.info(f"Scanning for device {mac_address}...")
-        device = await BleakScanner.find_device_by_address(mac_address, timeout=SCAN_TIMEOUT_SECONDS)
-        if not device:
-            logging.warning(f"Device {mac_address} not found after {SCAN_TIMEOUT_SECONDS} seconds.")
-            return None, None
+        device = cached_device
+        if device is None:
+            logging.info(f"Scanning for device {mac_address}...")
+            device = await BleakScanner.find_device_by_address(mac_address, timeout=SCAN_TIMEOUT_SECONDS)
+            if not device:
+                logging.warning(f"Device {mac_address} not found after {SCAN_TIMEOUT_SECONDS} seconds.")
+                return None, None
+            cached_device = device
+        else:
+            logging.info(f"Using cached device for {mac_address}, skipping scan.")
 
         logging.info(f"Attempting to connect to {mac_address} ({device.name or 'Unknown'})...")
         client = BleakClient(device, timeout=CONNECTION_TIMEOUT_SECONDS)
@@ -173,6 +221,9 @@ async def collect_single_reading(mac_address):
         logging.error(f"Unexpected error during collection for {mac_address}: {e}", exc_info=True)
         return None, None
     finally:
+        if collected_data is None:
+            # Rescan on the next attempt in case the cached device has gone stale
+            cached_device = None
         if client and client.is_connected:
             try:
                 logging.info(f"Disconnecting from {mac_address}...")
@@ -182,7 +233,10 @@ async def collect_single_reading(mac_address):
                 logging.error(f"Error during disconnect for {mac_address}: {e}")
 
 async def collector_loop():
+    loop = asyncio.get_running_loop()
     while True:
+        # Schedule against a deadline so scan and retry time don't drift the cadence
+        next_run = loop.time() + COLLECTION_INTERVAL_SECONDS
         temperature, humidity = None, None
         for attempt in range(1, MAX_COLLECTION_RETRIES + 1):
             logging.info(f"Collection attempt {attempt}/{MAX_COLLECTION_RETRIES} for {mac_to_monitor}...")
@@ -198,8 +252,9 @@ async def collector_loop():
         if temperature is None or humidity is None:
             logging.error(f"Failed to collect data from {mac_to_monitor} after {MAX_COLLECTION_RETRIES} attempts. Will try again in the next interval.")
 
-        logging.info(f"Waiting for {POLL_INTERVAL_MINUTES} minutes until next scheduled collection...")
-        await asyncio.sleep(COLLECTION_INTERVAL_SECONDS)
+        delay = max(0.0, next_run - loop.time())
+        logging.info(f"Waiting for {delay / 60:.1f} minutes until next scheduled collection...")
+        await asyncio.sleep(delay)
 
 async def retention_loop():
     while True:
@@ -209,15 +264,23 @@ async def retention_loop():
 
 async def main():
     setup_database()
+    # Let systemd stop the collector cleanly so the database connection gets closed
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
     asyncio.create_task(retention_loop())
     await collector_loop()
 
 if __name__ == "__main__":
     try:
         logging.info("Starting sensor data collector script...")
+        if uvloop is not None:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
         asyncio.run(main())
     except KeyboardInterrupt:
         logging.info("\nScript interrupted by user. Exiting.")
+    except asyncio.CancelledError:
+        logging.info("Received SIGTERM. Exiting.")
     except Exception as e:
         logging.critical(f"An unhandled critical error occurred: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        close_db_connection()
@@ -0,0 +1,32 @@
+from typing import Any
+
+# Kept in its own module so it can be compiled to a C extension with mypyc
+# (`mypyc sensor_format.py`). The compiled module is picked up automatically
+# on import; the plain Python version is used otherwise.
+
+def format_sensor_data_from_row(row: tuple[Any, ...], include_date: bool = True) -> dict[str, Any]:
+    """
+    Helper function to turn a database row selected with the API's history or
+    latest columns into the desired dictionary structure.
+
+    Args:
+        row (tuple): A single row fetched from the database, as (time, temp, humid[, date, ...]).
+        include_date (bool): If True, includes the 'date' field in the output.
+
+    Returns:
+        dict: Formatted sensor data.
+    """
+    time: str = row[0]
+    temp: float = row[1]
+    humid: int = row[2]
+    formatted_data: dict[str, Any] = {
+        "time": time,
+        "temp": temp,
+        "humid": humid
+    }
+
+    if include_date:
+        date: str = row[3]
+        formatted_data["date"] = date
+
+    return formatted_data